@@ -2,6 +2,7 @@
 
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Optional, List
 import logging
@@ -9,21 +10,50 @@ import logging
 try:
     from PIL import Image
     HAS_PILLOW = True
+    _LANCZOS = Image.Resampling.LANCZOS
 except ImportError:
     HAS_PILLOW = False
 
+try:
+    import pyvips
+    HAS_PYVIPS = True
+except (ImportError, OSError):
+    # OSError: pyvips installed but libvips shared library missing
+    HAS_PYVIPS = False
+
 logger = logging.getLogger(__name__)
 
 # Thumbnail sizes: (width, height, name_suffix)
-THUMBNAIL_SIZES = [
+THUMBNAIL_SIZES = (
     (110, 110, "thumb-sm"),      # Helper cards on public index
     (220, 220, "thumb-md"),      # 2x resolution for high-DPI displays
     (165, 165, "thumb-detail"),  # Helper cards on detail page
     (330, 330, "thumb-detail-2x"),  # 2x for detail page
-]
+)
+
+# Precomputed for the generation loops: sizes largest first (cascade order)
+# and the largest thumbnail edge used for the pre-shrunk intermediate
+_THUMBNAIL_SIZES_DESC = tuple(sorted(THUMBNAIL_SIZES, key=lambda s: s[0], reverse=True))
+_MAX_THUMB_DIM = max(max(width, height or width) for width, height, _ in THUMBNAIL_SIZES)
 
 CAROUSEL_SIZE = (1000, None)  # Max 1000px wide, maintain aspect ratio
 
+# Encoders (libwebp/libjpeg) release the GIL, so the variants of one image
+# are encoded in parallel threads
+ENCODE_WORKERS = min(12, os.cpu_count() or 1)
+
+# Shared pool for batch uploads: several images at once, created once instead of per request
+# (decoding, resizing and encoding release the GIL, so threads scale without forking the server)
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="thumbnails")
+
+# libwebp effort for the small thumbnails; method=6 is kept for the carousel image
+WEBP_THUMB_METHOD = 4
+
+# Thumbnails up to this size use libwebp's "icon" preset, larger ones "photo"
+# (presets are only exposed by libvips, Pillow has no equivalent option)
+WEBP_ICON_MAX_DIM = 165
+
 
 def get_thumbnail_paths(original_path: str, with_formats: List[str] = None) -> dict:
     """
@@ -34,24 +64,22 @@ def get_thumbnail_paths(original_path: str, with_formats: List[str] = None) -> d
         get_thumbnail_paths("uploads/photos/abc123.jpg")
         -> {
             "webp": ["uploads/photos/abc123-thumb-sm.webp", ...],
-            "avif": ["uploads/photos/abc123-thumb-sm.avif", ...],
             "jpg": ["uploads/photos/abc123-thumb-sm.jpg", ...],
         }
     """
     if with_formats is None:
-        with_formats = ["webp", "avif", "jpg"]
+        with_formats = ["webp", "jpg"]
     
-    path_obj = Path(original_path)
-    stem = path_obj.stem  # filename without extension
-    parent = path_obj.parent
+    # Plain string handling, these are static URL paths ("uploads/photos/abc123.jpg")
+    parent, _, filename = str(original_path).rpartition("/")
+    stem = os.path.splitext(filename)[0]  # filename without extension
+    prefix = f"{parent}/{stem}" if parent else stem
     
     thumbs = {fmt: [] for fmt in with_formats}
     
     for width, height, suffix in THUMBNAIL_SIZES:
         for fmt in with_formats:
-            thumb_name = f"{stem}-{suffix}.{fmt}"
-            thumb_path = parent / thumb_name
-            thumbs[fmt].append(str(thumb_path))
+            thumbs[fmt].append(f"{prefix}-{suffix}.{fmt}")
     
     return thumbs
 
@@ -62,20 +90,37 @@ def is_image_processable(file_path: Path) -> bool:
     return file_path.suffix.lower() in processable_exts
 
 
-def generate_thumbnails(original_path: Path, static_dir: Path, keep_original_format: bool = True) -> bool:
+def _compute_thumbnail_size(size: tuple, box: tuple) -> tuple:
+    """Size that fits into box while keeping the aspect ratio, like Image.thumbnail() (never enlarges)."""
+    width, height = size
+    max_width, max_height = box
+    if width <= max_width and height <= max_height:
+        return size
+    scale = min(max_width / width, max_height / height)
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def _save_variant(img: "Image.Image", path: Path, fmt: str, **params) -> None:
+    """Encode a single thumbnail/carousel variant. Runs inside the encoder thread pool."""
+    img.save(path, fmt, **params)
+    logger.info("Generated thumbnail: %s", path)
+
+
+def generate_thumbnails(original_path: Path, static_dir: Path, keep_original_format: bool = True, encode_workers: Optional[int] = None) -> bool:
     """
-    Generate thumbnails for the given image in multiple sizes and formats (webp, avif, jpg).
+    Generate thumbnails for the given image in multiple sizes and formats (webp, jpg).
     
     Args:
         original_path: Full path to the original image file (relative to static_dir if relative)
         static_dir: Base static directory path
-        keep_original_format: If True, also keep JPG/PNG version alongside WebP/AVIF
+        keep_original_format: If True, also keep JPG/PNG version alongside WebP
+        encode_workers: Encoder threads for this image (default: ENCODE_WORKERS)
     
     Returns:
         True if thumbnails were generated successfully, False otherwise
     """
-    if not HAS_PILLOW:
-        logger.warning("Pillow not installed. Skipping thumbnail generation.")
+    if not HAS_PILLOW and not HAS_PYVIPS:
+        logger.warning("Neither pyvips nor Pillow installed. Skipping thumbnail generation.")
         return False
     
     # Resolve to absolute path if needed
@@ -83,67 +128,135 @@ def generate_thumbnails(original_path: Path, static_dir: Path, keep_original_for
         original_path = static_dir / original_path
     
     if not original_path.exists():
-        logger.error(f"Original image not found: {original_path}")
+        logger.error("Original image not found: %s", original_path)
         return False
     
     if not is_image_processable(original_path):
-        logger.warning(f"Image type not processable (e.g., SVG): {original_path}")
+        logger.warning("Image type not processable (e.g., SVG): %s", original_path)
         return False
     
+    if HAS_PYVIPS:
+        return _generate_with_vips(original_path, keep_original_format)
+    
     try:
         with Image.open(original_path) as img:
+            # Let libjpeg scale down during decode (1/2, 1/4, 1/8), never below the carousel size
+            if img.format == "JPEG":
+                img.draft("RGB", (CAROUSEL_SIZE[0], CAROUSEL_SIZE[0]))
+            
             # Ensure RGBA or RGB for consistency
             if img.mode in ("RGBA", "LA", "P"):
                 # Convert RGBA to RGB with white background for better compression
-                if img.mode == "P":
+                if img.mode != "RGBA":
                     img = img.convert("RGBA")
-                if img.mode in ("RGBA", "LA"):
-                    background = Image.new("RGB", img.size, (255, 255, 255))
-                    if img.mode == "LA":
-                        img = img.convert("RGBA")
-                    background.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-                    img = background
+                background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(background, img).convert("RGB")
             elif img.mode != "RGB":
                 img = img.convert("RGB")
             
             # Generate carousel-size version (if width > 1000px)
-            img_carousel = img.copy()
-            if img.width > 1000 or img.height > 1000:
-                img_carousel.thumbnail((1000, 1000), Image.Resampling.LANCZOS)
-            
-            carousel_path = original_path.parent / f"{original_path.stem}-carousel.webp"
-            img_carousel.save(carousel_path, "WEBP", quality=85, method=6)
-            logger.info(f"Generated carousel version: {carousel_path}")
+            img_carousel = img.resize(_compute_thumbnail_size(img.size, (1000, 1000)), _LANCZOS, reducing_gap=2.0)
             
-            # Generate thumbnails
-            for width, height, suffix in THUMBNAIL_SIZES:
-                img_thumb = img.copy()
-                img_thumb.thumbnail((width, height) if height else (width, width), Image.Resampling.LANCZOS)
+            with ThreadPoolExecutor(max_workers=encode_workers or ENCODE_WORKERS) as executor:
+                futures = []
+                
+                carousel_path = original_path.parent / f"{original_path.stem}-carousel.webp"
+                futures.append(executor.submit(_save_variant, img_carousel, carousel_path, "WEBP", quality=85, method=6))
                 
-                # WebP
-                webp_path = original_path.parent / f"{original_path.stem}-{suffix}.webp"
-                img_thumb.save(webp_path, "WEBP", quality=80, method=6)
-                logger.info(f"Generated thumbnail: {webp_path}")
+                # Pre-shrink once to the largest thumbnail size and cascade the
+                # smaller sizes from it instead of from the full-resolution original
+                img_large = img.resize(_compute_thumbnail_size(img.size, (_MAX_THUMB_DIM, _MAX_THUMB_DIM)), _LANCZOS, reducing_gap=2.0)
                 
-                # AVIF (fallback graceful if pillow-heif not available)
-                try:
-                    avif_path = original_path.parent / f"{original_path.stem}-{suffix}.avif"
-                    img_thumb.save(avif_path, "AVIF", quality=75)
-                    logger.info(f"Generated thumbnail: {avif_path}")
-                except Exception as e:
-                    logger.warning(f"Could not save AVIF (pillow-heif needed): {e}")
+                # Generate thumbnails (largest first)
+                for width, height, suffix in _THUMBNAIL_SIZES_DESC:
+                    img_thumb = img_large.resize(_compute_thumbnail_size(img_large.size, (width, height or width)), _LANCZOS)
+                    
+                    # Image.save() stores the encoder options on the image itself,
+                    # so every concurrent save gets its own (small) copy
+                    # WebP
+                    webp_path = original_path.parent / f"{original_path.stem}-{suffix}.webp"
+                    futures.append(executor.submit(_save_variant, img_thumb.copy(), webp_path, "WEBP", quality=80, method=WEBP_THUMB_METHOD))
+                    
+                    # JPG (keep original format for fallback)
+                    if keep_original_format:
+                        jpg_path = original_path.parent / f"{original_path.stem}-{suffix}.jpg"
+                        futures.append(executor.submit(_save_variant, img_thumb, jpg_path, "JPEG", quality=82, progressive=True, subsampling="4:2:0"))
                 
-                # JPG (keep original format for fallback)
-                if keep_original_format:
-                    jpg_path = original_path.parent / f"{original_path.stem}-{suffix}.jpg"
-                    img_thumb.save(jpg_path, "JPEG", quality=80, optimize=True)
-                    logger.info(f"Generated thumbnail: {jpg_path}")
+                wait(futures)
+            
+            for future in futures:
+                future.result()
+        
+        logger.info("Successfully generated all thumbnails for: %s", original_path)
+        return True
+    
+    except Exception as e:
+        logger.error("Error generating thumbnails for %s: %s", original_path, e)
+        return False
+
+
+def generate_thumbnails_batch(paths: List[Path], static_dir: Path) -> List[bool]:
+    """
+    Generate thumbnails for several images in parallel on the shared batch thread pool, one task per image.
+    
+    Args:
+        paths: Original image paths (relative to static_dir or absolute)
+        static_dir: Base static directory path
+    
+    Returns:
+        List with the generate_thumbnails result for each path, in input order
+    """
+    if len(paths) <= 1:
+        return [generate_thumbnails(path, static_dir) for path in paths]
+    
+    # Split the encoder threads between the images processed at the same time,
+    # so a batch does not run more encode threads than a single image would
+    encode_workers = max(1, ENCODE_WORKERS // min(len(paths), BATCH_WORKERS))
+    futures = [_batch_executor.submit(generate_thumbnails, path, static_dir, encode_workers=encode_workers) for path in paths]
+    return [future.result() for future in futures]
+
+
+def _generate_with_vips(original_path: Path, keep_original_format: bool = True) -> bool:
+    """
+    pyvips variant of generate_thumbnails: shrink-on-load for the carousel version,
+    all thumbnails cascaded from in-memory intermediates. libvips threads internally.
+    """
+    try:
+        # thumbnail() from the file uses shrink-on-load (JPEG/WebP) and only shrinks;
+        # no_rotate keeps the pixel orientation identical to the Pillow path (no EXIF auto-rotation)
+        img_carousel = pyvips.Image.thumbnail(str(original_path), CAROUSEL_SIZE[0], height=CAROUSEL_SIZE[0], size="down", no_rotate=True)
+        if img_carousel.interpretation != "srgb":
+            img_carousel = img_carousel.colourspace("srgb")
+        if img_carousel.hasalpha():
+            img_carousel = img_carousel.flatten(background=[255, 255, 255])
+        img_carousel = img_carousel.copy_memory()
+        
+        carousel_path = original_path.parent / f"{original_path.stem}-carousel.webp"
+        img_carousel.webpsave(str(carousel_path), Q=85, effort=6, preset="photo", strip=True)
+        logger.info("Generated carousel version: %s", carousel_path)
+        
+        img_large = img_carousel.thumbnail_image(_MAX_THUMB_DIM, height=_MAX_THUMB_DIM, size="down", no_rotate=True).copy_memory()
+        
+        for width, height, suffix in _THUMBNAIL_SIZES_DESC:
+            img_thumb = img_large.thumbnail_image(width, height=height or width, size="down", no_rotate=True)
+            
+            # WebP
+            webp_path = original_path.parent / f"{original_path.stem}-{suffix}.webp"
+            preset = "icon" if max(width, height or width) <= WEBP_ICON_MAX_DIM else "photo"
+            img_thumb.webpsave(str(webp_path), Q=80, effort=WEBP_THUMB_METHOD, preset=preset, strip=True)
+            logger.info("Generated thumbnail: %s", webp_path)
+            
+            # JPG (keep original format for fallback)
+            if keep_original_format:
+                jpg_path = original_path.parent / f"{original_path.stem}-{suffix}.jpg"
+                img_thumb.jpegsave(str(jpg_path), Q=82, interlace=True, subsample_mode="on", strip=True)
+                logger.info("Generated thumbnail: %s", jpg_path)
         
-        logger.info(f"Successfully generated all thumbnails for: {original_path}")
+        logger.info("Successfully generated all thumbnails for: %s", original_path)
         return True
     
     except Exception as e:
-        logger.error(f"Error generating thumbnails for {original_path}: {e}")
+        logger.error("Error generating thumbnails for %s: %s", original_path, e)
         return False
 
 
@@ -163,37 +276,31 @@ def delete_thumbnails(original_path: Path, static_dir: Path) -> bool:
         original_path = static_dir / original_path
     
     if not original_path.exists():
-        logger.warning(f"Original image not found for cleanup: {original_path}")
+        logger.warning("Original image not found for cleanup: %s", original_path)
         return False
     
-    stem = original_path.stem
-    parent = original_path.parent
+    prefix = os.path.join(str(original_path.parent), original_path.stem)
     
     deleted_count = 0
     
-    # Delete carousel version
-    carousel_path = parent / f"{stem}-carousel.webp"
-    if carousel_path.exists():
+    # Carousel version and all thumbnail variants
+    # (AVIF variants are no longer generated but may exist for older uploads)
+    expected = [f"{prefix}-{suffix}.{fmt}" for _, _, suffix in THUMBNAIL_SIZES for fmt in ("webp", "avif", "jpg")]
+    expected.append(f"{prefix}-carousel.webp")
+    
+    # Unlink directly and treat a missing file as "nothing to delete": one syscall
+    # per candidate, no exists() stat and no listing of the (large) upload directory
+    for name in expected:
         try:
-            carousel_path.unlink()
+            os.unlink(name)
             deleted_count += 1
-            logger.info(f"Deleted carousel version: {carousel_path}")
-        except Exception as e:
-            logger.error(f"Error deleting carousel version: {e}")
+            logger.info("Deleted thumbnail: %s", name)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Error deleting thumbnail %s: %s", name, e)
     
-    # Delete all thumbnail variants
-    for width, height, suffix in THUMBNAIL_SIZES:
-        for fmt in ["webp", "avif", "jpg"]:
-            thumb_path = parent / f"{stem}-{suffix}.{fmt}"
-            if thumb_path.exists():
-                try:
-                    thumb_path.unlink()
-                    deleted_count += 1
-                    logger.info(f"Deleted thumbnail: {thumb_path}")
-                except Exception as e:
-                    logger.error(f"Error deleting thumbnail {thumb_path}: {e}")
-    
-    logger.info(f"Deleted {deleted_count} thumbnail variants for: {original_path}")
+    logger.info("Deleted %s thumbnail variants for: %s", deleted_count, original_path)
     return True
 
 
@@ -218,12 +325,13 @@ def delete_original_and_thumbnails(original_path: Path, static_dir: Path) -> boo
         success = False
     
     # Delete original
-    if original_path.exists():
-        try:
-            original_path.unlink()
-            logger.info(f"Deleted original image: {original_path}")
-        except Exception as e:
-            logger.error(f"Error deleting original image: {e}")
-            success = False
+    try:
+        os.unlink(original_path)
+        logger.info("Deleted original image: %s", original_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error("Error deleting original image: %s", e)
+        success = False
     
     return success
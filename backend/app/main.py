@@ -1,6 +1,7 @@
 import subprocess
 from datetime import datetime
 import os
+import secrets
 import asyncio
 import sys
 from typing import Optional, List
@@ -10,6 +11,13 @@ import tempfile
 from pathlib import Path
 import csv
 import io
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlencode
+import threading
+import time
 
 from fastapi import FastAPI, Request, Depends, Form, UploadFile, File, HTTPException
 from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, StreamingResponse
@@ -17,19 +25,24 @@ from fastapi.staticfiles import StaticFiles
 from starlette.responses import Response
 from starlette.middleware.gzip import GZipMiddleware
 import itertools
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, contains_eager, selectinload, raiseload
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, ModuleLoader
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette.status import HTTP_303_SEE_OTHER
-from sqlalchemy import or_, text, exists
+from sqlalchemy import event, or_, text, exists, tuple_
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func as sa_func
+from sqlalchemy import select, insert, update, delete, func as sa_func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
-from .database import Base, engine, get_db
+from .database import Base, SessionLocal, checkpoint_wal, engine, get_db
 from .models import Group, Function, Helper, Setting, CarouselImage, GroupImage, helper_secondary_functions
 from .version import __version__
-from .image_processor import generate_thumbnails, delete_original_and_thumbnails
+from .image_processor import generate_thumbnails, generate_thumbnails_batch, delete_original_and_thumbnails, ENCODE_WORKERS
 
+# StaticFiles liefert bereits ETag/Last-Modified und beantwortet If-None-Match mit 304;
+# hier wird nur Cache-Control ergänzt (die Upload-Dateinamen sind zufällig und ändern sich nie)
 class CacheStaticFiles(StaticFiles):
     def __init__(self, *args, **kwargs):
         self.cache_timeout = 31536000  # 1 Jahr in Sekunden
@@ -40,6 +53,8 @@ class CacheStaticFiles(StaticFiles):
         response.headers["Cache-Control"] = f"public, max-age={self.cache_timeout}, immutable"
         return response
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Helferboard")
 
 # Enable Gzip compression for responses >= 1000 bytes
@@ -53,14 +68,30 @@ app.mount("/static/uploads/emblems",  CacheStaticFiles(directory=static_dir / "u
 app.mount("/static/uploads/groups",   CacheStaticFiles(directory=static_dir / "uploads/groups"),   name="groups")
 app.mount("/static/uploads/carousel", CacheStaticFiles(directory=static_dir / "uploads/carousel"), name="carousel")
 
+# ENV=prod: Templates beim Start einmal in ein Modul-Archiv kompilieren und nur noch daraus laden
+ENV = os.getenv("ENV", "dev").lower()
+
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 templates.env.add_extension('jinja2.ext.do')
+templates.env.trim_blocks = True
+templates.env.lstrip_blocks = True
+# Kompilierte Templates im Temp-Verzeichnis zwischenspeichern, Quellen nicht bei jedem Aufruf auf Änderungen prüfen
+templates.env.bytecode_cache = FileSystemBytecodeCache()
+templates.env.auto_reload = False
+if ENV == "prod":
+    compiled_templates = BASE_DIR.parent / "compiled_templates.zip"
+    templates.env.compile_templates(str(compiled_templates), zip="deflated", ignore_errors=False)
+    templates.env.loader = ModuleLoader(str(compiled_templates))
 
 # Auth
 security = HTTPBasic()
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")
 
+# Debug-Modus: nicht vorab geladene Relationen auf Listen-Seiten lösen einen Fehler statt einer Einzelabfrage aus
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes")
+RAISELOAD = [raiseload('*')] if DEBUG else []
+
 def require_admin(credentials: HTTPBasicCredentials = Depends(security)):
     if not (credentials.username == ADMIN_USER and credentials.password == ADMIN_PASSWORD):
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -80,65 +111,87 @@ def initialize_last_update():
     except Exception as e:
         print(f"Error initializing settings: {e}")
 
-def get_last_update(db: Session) -> datetime:
-    setting = db.query(Setting).filter(Setting.key == "last_update").first()
+@app.on_event("startup")
+def preload_templates():
+    templates_dir = BASE_DIR / "templates"
+    for template_path in templates_dir.rglob("*.html"):
+        templates.env.get_template(template_path.relative_to(templates_dir).as_posix())
+
+def load_settings(db: Session) -> dict:
+    """Alle Settings mit einer Abfrage laden; pro Session (= pro Request) zwischengespeichert."""
+    if "settings" not in db.info:
+        db.info["settings"] = dict(db.execute(select(Setting.key, Setting.value)).all())
+    return db.info["settings"]
+
+def _set_setting(db: Session, key: str, value: str):
+    setting = db.query(Setting).filter(Setting.key == key).first()
     if setting:
-        return datetime.fromisoformat(setting.value)
+        setting.value = value
+    else:
+        setting = Setting(key=key, value=value)
+        db.add(setting)
+    db.info.pop("settings", None)
+
+def get_last_update(db: Session) -> datetime:
+    value = load_settings(db).get("last_update")
+    if value:
+        return datetime.fromisoformat(value)
     return datetime.now()
 
 def set_last_update(db: Session):
-    now = datetime.now()
-    setting = db.query(Setting).filter(Setting.key == "last_update").first()
-    if setting:
-        setting.value = now.isoformat()
-    else:
-        setting = Setting(key="last_update", value=now.isoformat())
-        db.add(setting)
+    # Nur vormerken: der Zeitstempel wird einmal pro Transaktion direkt vor dem Commit geschrieben
+    db.info["last_update_dirty"] = True
+
+@event.listens_for(SessionLocal, "before_commit")
+def _write_last_update(session: Session):
+    if session.info.pop("last_update_dirty", False):
+        stmt = sqlite_insert(Setting).values(key="last_update", value=datetime.now().isoformat())
+        session.execute(stmt.on_conflict_do_update(index_elements=[Setting.key], set_={"value": stmt.excluded.value}))
+        session.info.pop("settings", None)
 
 def get_incognito_level(db: Session) -> int:
-    setting = db.query(Setting).filter(Setting.key == "incognito_level").first()
-    if setting:
+    value = load_settings(db).get("incognito_level")
+    if value is not None:
         try:
-            return int(setting.value)
+            return int(value)
         except:
             return 0
     return 0
 
 def set_incognito_level(db: Session, value: int):
-    setting = db.query(Setting).filter(Setting.key == "incognito_level").first()
-    if setting:
-        setting.value = str(value)
-    else:
-        setting = Setting(key="incognito_level", value=str(value))
-        db.add(setting)
+    _set_setting(db, "incognito_level", str(value))
 
 def get_carousel_title(db: Session) -> str:
-    setting = db.query(Setting).filter(Setting.key == "carousel_title").first()
-    return setting.value if setting else ""
+    return load_settings(db).get("carousel_title", "")
 
 def set_carousel_title(db: Session, title: str):
-    setting = db.query(Setting).filter(Setting.key == "carousel_title").first()
-    if setting:
-        setting.value = title
-    else:
-        setting = Setting(key="carousel_title", value=title)
-        db.add(setting)
+    _set_setting(db, "carousel_title", title)
 
-def save_upload(upload: Optional[UploadFile], subdir: str) -> Optional[str]:
-    if not upload:
-        return None
+# Upload types for which thumbnail variants are generated
+THUMBNAIL_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+def _store_upload(upload: UploadFile, subdir: str, thumbnails: bool = True) -> str:
     ext = os.path.splitext(upload.filename or "")[1].lower()
-    if subdir == "uploads/emblems" and ext != ".svg":
-        raise HTTPException(status_code=400, detail="Emblem muss SVG sein")
+    # Größe aus dem bereits geparsten Multipart-Teil bzw. Content-Length, ohne die Datei zu lesen
+    size = upload.size if upload.size is not None else int(upload.headers.get("content-length") or 0)
+    if size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="Datei ist zu groß")
+    if subdir == "uploads/emblems":
+        # Nur den Anfang der Datei prüfen, danach zurückspulen und normal kopieren
+        head = upload.file.read(512)
+        upload.file.seek(0)
+        if ext != ".svg" or (b"<svg" not in head and b"<?xml" not in head):
+            raise HTTPException(status_code=400, detail="Emblem muss SVG sein")
     target_dir = static_dir / subdir
     target_dir.mkdir(parents=True, exist_ok=True)
-    fname = f"{os.urandom(8).hex()}{ext}"
+    fname = f"{secrets.token_hex(8)}{ext}"
     out_path = target_dir / fname
     with out_path.open("wb") as f:
-        f.write(upload.file.read())
+        shutil.copyfileobj(upload.file, f, length=1024 * 1024)
     
     # Generate thumbnail variants if it's an image (not SVG)
-    if subdir != "uploads/emblems" and ext in {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}:
+    if thumbnails and subdir != "uploads/emblems" and ext in THUMBNAIL_EXTENSIONS:
         generate_thumbnails(out_path, static_dir)
     
     return f"{subdir}/{fname}"
@@ -148,26 +201,58 @@ def get_used_functions(db: Session) -> List[Function]:
     Returns a list of Function objects that are actually used by helpers (as main or secondary functions),
     filtered by sort_order > 0, and sorted ascending by sort_order.
     """
-    # Subquery for functions used as main functions
-    main_subquery = db.query(Function.id).join(Helper, Helper.main_function_id == Function.id).subquery()
+    stmt = (
+        select(Function)
+        .where(
+            Function.sort_order > 0,
+            or_(
+                exists().where(Helper.main_function_id == Function.id),
+                exists().where(helper_secondary_functions.c.function_id == Function.id),
+            ),
+        )
+        .order_by(Function.sort_order.asc())
+    )
+    return db.execute(stmt).scalars().all()
+
+# Auswahllisten für die Admin-Formulare und Navigation, zwischengespeichert bis zur nächsten Änderung (last_update).
+# Die Objekte sind detached: nur Spalten lesen, in Templates über die ID vergleichen.
+@lru_cache(maxsize=4)
+def _sorted_groups(last_update_iso: str) -> List[Group]:
+    with SessionLocal() as db:
+        return db.query(Group).order_by(Group.sort_order.asc(), Group.name.asc()).all()
+
+@lru_cache(maxsize=4)
+def _sorted_functions(last_update_iso: str) -> List[Function]:
+    with SessionLocal() as db:
+        return db.query(Function).order_by(Function.sort_order.asc(), Function.name.asc()).all()
 
-    # Subquery for functions used as secondary functions
-    secondary_subquery = db.query(helper_secondary_functions.c.function_id).subquery()
+@lru_cache(maxsize=4)
+def _detail_groups(last_update_iso: str) -> List[Group]:
+    with SessionLocal() as db:
+        return db.query(Group).options(*RAISELOAD).filter(Group.detail_enabled == 1).order_by(Group.sort_order.asc()).all()
 
-    # Combine and filter
-    used_function_ids = db.query(Function.id).filter(
-        (Function.id.in_(main_subquery)) | (Function.id.in_(secondary_subquery))
-    ).filter(Function.sort_order > 0).subquery()
+def all_detail_groups(db: Session) -> List[Group]:
+    return _detail_groups(get_last_update(db).isoformat())
 
-    # Get the functions, sorted by sort_order ascending
-    functions = db.query(Function).filter(Function.id.in_(used_function_ids)).order_by(Function.sort_order.asc()).all()
+def all_groups_sorted(db: Session) -> List[Group]:
+    return _sorted_groups(get_last_update(db).isoformat())
 
-    return functions
+def all_functions_sorted(db: Session) -> List[Function]:
+    return _sorted_functions(get_last_update(db).isoformat())
+
+def _next_sort_order(column, *criteria):
+    # Als Unterabfrage im INSERT ausgewertet: kein eigener Roundtrip für max(sort_order)
+    return select(sa_func.coalesce(sa_func.max(column), 0) + 10).where(*criteria).scalar_subquery()
 
 # ---------- Public ----------
 @app.get("/favicon.ico", include_in_schema=False)
-async def favicon():
-    return FileResponse(static_dir / "favicon.ico")
+async def favicon(request: Request):
+    favicon_path = static_dir / "favicon.ico"
+    # stat_result übergeben, damit ETag/Last-Modified schon hier gesetzt sind
+    response = FileResponse(favicon_path, stat_result=os.stat(favicon_path), headers={"Cache-Control": "public, max-age=604800"})
+    if request.headers.get("if-none-match") == response.headers["etag"]:
+        return Response(status_code=304, headers={"ETag": response.headers["etag"], "Cache-Control": response.headers["cache-control"]})
+    return response
 
 @app.exception_handler(HTTPException)
 async def custom_http_exception_handler(request: Request, exc: HTTPException):
@@ -180,54 +265,86 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
     # Optional: Andere Fehler standardmäßig behandeln
     return HTMLResponse(content=str(exc.detail), status_code=exc.status_code)
 
-@app.get("/", response_class=HTMLResponse)
-def public_index(request: Request, db: Session = Depends(get_db)):
-    incognito_level = get_incognito_level(db)
+# Prozessweiter Cache für die öffentliche Startseite. Schlüssel ist der last_update-Zeitstempel,
+# der bei jeder Änderung neu gesetzt wird; zusätzlich verfällt ein Eintrag nach PUBLIC_CACHE_TTL Sekunden.
+PUBLIC_CACHE_TTL = 300
+
+# Baumreihenfolge (Tiefensuche, Geschwister nach sort_order, name) per rekursiver CTE:
+# Pfad aus den Positionen unter dem jeweiligen Elternknoten, feste Breite damit er als Text sortierbar ist
+GROUP_TREE_SQL = text("""
+    WITH RECURSIVE ordered(id, parent_id, pos) AS (
+        SELECT id, parent_id, printf('%06d', ROW_NUMBER() OVER (PARTITION BY parent_id ORDER BY sort_order, name))
+        FROM groups
+    ),
+    tree(id, level, path) AS (
+        SELECT id, 0, pos FROM ordered WHERE parent_id IS NULL
+        UNION ALL
+        SELECT o.id, tree.level + 1, tree.path || '/' || o.pos FROM ordered o JOIN tree ON o.parent_id = tree.id
+    )
+    SELECT id, level FROM tree ORDER BY path
+""")
+
+def build_public_index_context(db: Session, incognito_level: int) -> dict:
     carousel_title = get_carousel_title(db) if incognito_level >= 2 else ""
     carousel_images = []
     if incognito_level >= 2:
         try:
-            carousel_images = db.query(CarouselImage).order_by(CarouselImage.sort_order.asc()).all()
+            carousel_images = db.query(CarouselImage).options(*RAISELOAD).order_by(CarouselImage.sort_order.asc()).all()
         except:
             carousel_images = []
-    def build(parent_id=None, level=0):
-        groups = db.query(Group).filter(Group.parent_id == parent_id).order_by(Group.sort_order.asc(), Group.name.asc()).all()
-        result = []
-        for g in groups:
-            helpers = (
-                db.query(Helper)
-                .filter(Helper.group_id == g.id)
-                .outerjoin(Helper.main_function)
-                .order_by(Function.sort_order.asc(), Helper.last_name.asc(), Helper.first_name.asc())
-                .all()
-            )
-            result.append({"group": g, "level": level, "helpers": helpers})
-            result.extend(build(g.id, level+1))
-        return result
-    tree = build(None, 0)
+    # Alle Gruppen und Helfer mit je einer Abfrage laden, Baum im Speicher aufbauen
+    groups = db.query(Group).options(*RAISELOAD).order_by(Group.sort_order.asc(), Group.name.asc()).all()
+    helpers = (
+        db.query(Helper)
+        .outerjoin(Helper.main_function)
+        .options(contains_eager(Helper.main_function), *RAISELOAD)
+        .order_by(Function.sort_order.asc(), Helper.last_name.asc(), Helper.first_name.asc())
+        .all()
+    )
+    helpers_by_group = defaultdict(list)
+    for h in helpers:
+        helpers_by_group[h.group_id].append(h)
+    groups_by_id = {g.id: g for g in groups}
+    tree = [
+        {"group": groups_by_id[group_id], "level": level, "helpers": helpers_by_group.get(group_id, [])}
+        for group_id, level in db.execute(GROUP_TREE_SQL)
+    ]
     # Gruppen mit Detailseiten
-    detail_groups = db.query(Group).filter(Group.detail_enabled == 1).order_by(Group.sort_order.asc()).all()
+    detail_groups = [g for g in groups if g.detail_enabled]
     allFunctionsInUse = get_used_functions(db)
-    return templates.TemplateResponse("public_index.html", {"request": request, "tree": tree, "incognito_level": incognito_level, "carousel_title": carousel_title, "carousel_images": carousel_images, "detail_groups": detail_groups, "allFunctionsInUse": allFunctionsInUse})
+    return {"tree": tree, "incognito_level": incognito_level, "carousel_title": carousel_title, "carousel_images": carousel_images, "detail_groups": detail_groups, "allFunctionsInUse": allFunctionsInUse}
+
+@lru_cache(maxsize=8)
+def _cached_public_index_context(last_update_iso: str, incognito_level: int, ttl_bucket: int) -> dict:
+    # Eigene Session: die Objekte werden über Requests hinweg (detached) wiederverwendet
+    with SessionLocal() as db:
+        return build_public_index_context(db, incognito_level)
+
+@app.get("/", response_class=HTMLResponse)
+def public_index(request: Request, db: Session = Depends(get_db)):
+    incognito_level = get_incognito_level(db)
+    context = _cached_public_index_context(get_last_update(db).isoformat(), incognito_level, int(time.monotonic() // PUBLIC_CACHE_TTL))
+    return templates.TemplateResponse("public_index.html", {"request": request, **context})
 
 @app.get("/group/{group_id}", response_class=HTMLResponse)
 def group_detail(group_id: int, request: Request, db: Session = Depends(get_db)):
-    group = db.query(Group).get(group_id)
+    group = db.get(Group, group_id)
     if not group or not group.detail_enabled:
         raise HTTPException(404)
     
     incognito_level = get_incognito_level(db)
-    images = db.query(GroupImage).filter(GroupImage.group_id == group_id).order_by(GroupImage.sort_order.asc()).all()
-    detail_groups = db.query(Group).filter(Group.detail_enabled == 1).order_by(Group.sort_order.asc()).all()
+    images = db.query(GroupImage).options(*RAISELOAD).filter(GroupImage.group_id == group_id).order_by(GroupImage.sort_order.asc()).all()
+    detail_groups = all_detail_groups(db)
     
-    helpers_query = (
+    # many-to-one per JOIN, many-to-many per separatem IN-Select (kein kartesisches Produkt)
+    helpers = (
         db.query(Helper)
-        .join(Helper.main_function)
         .filter(Helper.group_id == group_id)
-        .options(joinedload(Helper.main_function), joinedload(Helper.secondary_functions))
-        .order_by(Function.sort_order.asc(), Helper.last_name.asc())
+        .options(joinedload(Helper.main_function, innerjoin=True), selectinload(Helper.secondary_functions), *RAISELOAD)
+        .all()
     )
-    helpers = helpers_query.all()
+    # Sortierung nach Funktion (NULL zuerst wie in SQLite), Funktions-ID hält Gruppen für groupby zusammen
+    helpers.sort(key=lambda h: (h.main_function.sort_order is not None, h.main_function.sort_order or 0, h.main_function.id, h.last_name))
 
     helpers_by_function = []
     if helpers:
@@ -264,7 +381,7 @@ def settings_page(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("admin/settings.html", {"request": request, "incognito_level": incognito_level, "carousel_title": carousel_title, "carousel_images": carousel_images})
 
 @app.post("/admin/settings/save")
-async def settings_save(incognito_level: int = Form(0), carousel_title: str = Form(""), db: Session = Depends(get_db)):  #, _: bool = Depends(require_admin)
+def settings_save(incognito_level: int = Form(0), carousel_title: str = Form(""), db: Session = Depends(get_db)):  #, _: bool = Depends(require_admin)
     set_incognito_level(db, incognito_level)
     set_carousel_title(db, carousel_title)
     set_last_update(db)
@@ -272,19 +389,18 @@ async def settings_save(incognito_level: int = Form(0), carousel_title: str = Fo
     return RedirectResponse(url="/admin/settings", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/settings/upload_carousel")
-async def upload_carousel(image: UploadFile = File(...), db: Session = Depends(get_db)):
-    path = save_upload(image, "uploads/carousel")
+def upload_carousel(image: UploadFile = File(...), db: Session = Depends(get_db)):
+    path = _store_upload(image, "uploads/carousel")
     if path:
-        max_sort = db.query(sa_func.max(CarouselImage.sort_order)).scalar() or 0
-        carousel_img = CarouselImage(path=path, sort_order=max_sort + 10)
+        carousel_img = CarouselImage(path=path, sort_order=_next_sort_order(CarouselImage.sort_order))
         db.add(carousel_img)
         set_last_update(db)
         db.commit()
     return RedirectResponse(url="/admin/settings", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/settings/delete_carousel/{img_id}")
-async def delete_carousel(img_id: int, db: Session = Depends(get_db)):
-    img = db.query(CarouselImage).get(img_id)
+def delete_carousel(img_id: int, db: Session = Depends(get_db)):
+    img = db.get(CarouselImage, img_id)
     if img:
         # Datei und Thumbnails löschen
         try:
@@ -298,7 +414,7 @@ async def delete_carousel(img_id: int, db: Session = Depends(get_db)):
 
 # ---------- Export/Import Endpoints ----------
 @app.post("/admin/settings/export")
-async def export_data(db: Session = Depends(get_db)):
+def export_data(db: Session = Depends(get_db)):
     """Export all data (database + uploads) as ZIP file"""
     try:
         # Create ZIP file in memory
@@ -308,6 +424,7 @@ async def export_data(db: Session = Depends(get_db)):
             # Add database file
             db_path = BASE_DIR.parent / "db" / "app.db"
             if db_path.exists():
+                checkpoint_wal()
                 zipf.write(db_path, arcname="db/app.db")
             
             # Add uploads directory
@@ -333,7 +450,7 @@ async def export_data(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
 @app.post("/admin/settings/import")
-async def import_data(backup_file: UploadFile = File(...), db: Session = Depends(get_db)):
+def import_data(backup_file: UploadFile = File(...), db: Session = Depends(get_db)):
     """Import data from ZIP backup file"""
 
      # Validate file extension
@@ -356,7 +473,7 @@ async def import_data(backup_file: UploadFile = File(...), db: Session = Depends
         
 
             # Save uploaded file
-            content = await backup_file.read()
+            content = backup_file.file.read()
             with open(zip_path, 'wb') as f:
                 f.write(content)
             
@@ -373,6 +490,7 @@ async def import_data(backup_file: UploadFile = File(...), db: Session = Depends
             
             # Backup current database and uploads
             if db_current_path.exists():
+                checkpoint_wal()
                 shutil.copy(db_current_path, db_backup_path)
             
             if uploads_current_path.exists():
@@ -386,6 +504,9 @@ async def import_data(backup_file: UploadFile = File(...), db: Session = Depends
             try:
                 # Close current database connection
                 db.close()
+                # Alle Verbindungen schließen, damit keine alte WAL-Datei auf die neue Datenbank angewendet wird
+                checkpoint_wal()
+                engine.dispose()
                 
                 # Replace database file
                 if db_file.exists():
@@ -419,8 +540,7 @@ async def import_data(backup_file: UploadFile = File(...), db: Session = Depends
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
     
     # Delete backup files since import was successful
-    if db_backup_path.exists():
-        db_backup_path.unlink()
+    db_backup_path.unlink(missing_ok=True)
     if uploads_backup_path.exists():
         shutil.rmtree(uploads_backup_path)
 
@@ -441,48 +561,68 @@ def install_requirements(backend_dir="/backend", req_file="requirements.txt", ti
         raise FileNotFoundError(f"Requirements-Datei nicht gefunden: {req_path}")
 
     print(f"Installiere Dependencies aus {req_path} …")
+    # Ausgabe zeilenweise durchreichen statt komplett im Speicher zu sammeln
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "pip", "install", "-r", str(req_path)],
+        cwd=str(backend_path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    # Das Timeout muss auch greifen, während die Schleife auf die nächste Zeile wartet
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    killer = threading.Timer(timeout, _kill) if timeout is not None else None
+    if killer:
+        killer.start()
     try:
-        result = subprocess.run(
-            [sys.executable, "-m", "pip", "install", "-r", str(req_path)],
-            cwd=str(backend_path),          
-            check=True,                     
-            text=True,                      
-            capture_output=True,            
-            timeout=timeout                 
-        )
-        print(result.stdout)
-        print("✅ Installation abgeschlossen.")
-    except subprocess.CalledProcessError as e:
-        print("❌ Installation fehlgeschlagen.")
-        print("STDOUT:\n", e.stdout)
-        print("STDERR:\n", e.stderr)
-        raise
-    except subprocess.TimeoutExpired as e:
+        for line in proc.stdout:
+            print(line, end="")
+        returncode = proc.wait()
+    finally:
+        if killer:
+            killer.cancel()
+        proc.stdout.close()
+    if timed_out.is_set():
         print(f"⏱️ Timeout nach {timeout} Sekunden.")
-        raise
+        raise subprocess.TimeoutExpired(proc.args, timeout)
+    if returncode:
+        print("❌ Installation fehlgeschlagen.")
+        raise subprocess.CalledProcessError(returncode, proc.args)
+    print("✅ Installation abgeschlossen.")
 
 
 @app.post("/admin/groups/{group_id}/upload_image")
-async def upload_group_image(group_id: int, images: List[UploadFile] = File(...), db: Session = Depends(get_db)):
-    group = db.query(Group).get(group_id)
+def upload_group_image(group_id: int, images: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    group = db.get(Group, group_id)
     if not group:
         raise HTTPException(404)
     
     max_sort = db.query(sa_func.max(GroupImage.sort_order)).filter(GroupImage.group_id == group_id).scalar() or 0
     
+    saved_paths = []
     for image in images:
-        path = save_upload(image, f"uploads/groups/{group_id}")
+        path = _store_upload(image, f"uploads/groups/{group_id}", thumbnails=False)
         if path:
+            saved_paths.append(path)
             max_sort += 10
             group_img = GroupImage(path=path, group_id=group_id, sort_order=max_sort)
             db.add(group_img)
 
+    # Thumbnails for all uploaded images in parallel
+    thumb_paths = [Path(p) for p in saved_paths if Path(p).suffix.lower() in THUMBNAIL_EXTENSIONS]
+    generate_thumbnails_batch(thumb_paths, static_dir)
+
     set_last_update(db)
     db.commit()
     return RedirectResponse(url=f"/admin/groups/{group_id}", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/groups/{group_id}/delete_image/{img_id}")
-async def delete_group_image(group_id: int, img_id: int, db: Session = Depends(get_db)):
+def delete_group_image(group_id: int, img_id: int, db: Session = Depends(get_db)):
     img = db.query(GroupImage).filter(GroupImage.id == img_id, GroupImage.group_id == group_id).first()
     if img:
         # Datei und Thumbnails löschen
@@ -495,9 +635,33 @@ async def delete_group_image(group_id: int, img_id: int, db: Session = Depends(g
         db.commit()
     return RedirectResponse(url=f"/admin/groups/{group_id}", status_code=HTTP_303_SEE_OTHER)
 
+# ---------- CSV-Import ----------
+# Zeilen pro INSERT-Statement (bleibt mit 4 Spalten unter dem SQLite-Limit von 999 Parametern)
+CSV_BATCH_SIZE = 200
+
+def _opt_int(value: str) -> Optional[int]:
+    # Optionale ID-Spalte: leer oder nicht numerisch -> None (int() direkt, der Normalfall ist eine gültige Zahl)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def _batched(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _load_in(query, column, values) -> list:
+    # IN-Abfrage in Batches, damit große CSV-Dateien das Parameter-Limit von SQLite nicht überschreiten
+    result = []
+    for batch in _batched(list(values), CSV_BATCH_SIZE):
+        result.extend(query.filter(column.in_(batch)).all())
+    return result
+
 # ---------- Groups CRUD ----------
 @app.post("/admin/groups/import")
-async def import_groups_from_csv(
+def import_groups_from_csv(
     csv_file: UploadFile = File(...), 
     db: Session = Depends(get_db),
     # _: bool = Depends(require_admin) # Temporarily disabled for testing
@@ -505,7 +669,7 @@ async def import_groups_from_csv(
     if not csv_file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
 
-    content = await csv_file.read()
+    content = csv_file.file.read()
     try:
         # We need to decode the content to a string to use io.StringIO
         content_as_string = content.decode('utf-8')
@@ -518,8 +682,7 @@ async def import_groups_from_csv(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Fehler beim Lesen der CSV-Datei: {e}")
 
-    groups_in_db = {g.id: g for g in db.query(Group).all()}
-
+    rows = []
     for row in reader:
         try:
             group_id = int(row[0])
@@ -528,15 +691,7 @@ async def import_groups_from_csv(
 
             parent_id = int(parent_id_str) if parent_id_str and parent_id_str.isdigit() and int(parent_id_str) != 0 else None
 
-            if group_id in groups_in_db:
-                # Update existing group
-                group = groups_in_db[group_id]
-                group.name = name
-                group.parent_id = parent_id
-            else:
-                # Create new group
-                group = Group(id=group_id, name=name, parent_id=parent_id)
-                db.add(group)
+            rows.append({"id": group_id, "name": name, "parent_id": parent_id})
 
         except (ValueError, IndexError) as e:
             # Handle potential errors in row data
@@ -544,6 +699,11 @@ async def import_groups_from_csv(
             print(f"Skipping row due to error: {row}, {e}")
             continue
 
+    # Insert new / update existing groups in batches (upsert on id)
+    for batch in _batched(rows, CSV_BATCH_SIZE):
+        stmt = sqlite_insert(Group).values(batch)
+        db.execute(stmt.on_conflict_do_update(index_elements=[Group.id], set_={"name": stmt.excluded.name, "parent_id": stmt.excluded.parent_id}))
+
     set_last_update(db)
     db.commit()
 
@@ -551,25 +711,25 @@ async def import_groups_from_csv(
 
 @app.get("/admin/groups", response_class=HTMLResponse)
 def groups_list(request: Request, db: Session = Depends(get_db)):
-    groups = db.query(Group).order_by(Group.parent_id.asc(), Group.sort_order.asc(), Group.name.asc()).all()
+    groups = db.query(Group).options(joinedload(Group.parent), *RAISELOAD).order_by(Group.parent_id.asc(), Group.sort_order.asc(), Group.name.asc()).all()
     return templates.TemplateResponse("admin/groups_list.html", {"request": request, "groups": groups})
 
 @app.get("/admin/groups/new", response_class=HTMLResponse)
 def group_new(request: Request, db: Session = Depends(get_db)):
-    parents = db.query(Group).order_by(Group.sort_order.asc(), Group.name.asc()).all()
+    parents = all_groups_sorted(db)
     return templates.TemplateResponse("admin/groups_form.html", {"request": request, "group": None, "parents": parents})
 
 @app.get("/admin/groups/{group_id}", response_class=HTMLResponse)
 def group_edit(group_id: int, request: Request, db: Session = Depends(get_db)):
-    g = db.query(Group).get(group_id)
+    g = db.get(Group, group_id)
     if not g:
         raise HTTPException(404)
-    parents = db.query(Group).filter(Group.id != group_id).order_by(Group.sort_order.asc(), Group.name.asc()).all()
+    parents = [p for p in all_groups_sorted(db) if p.id != group_id]
     helpers = db.query(Helper).filter(Helper.group_id == group_id).all()
     return templates.TemplateResponse("admin/groups_form.html", {"request": request, "group": g, "parents": parents, "helpers": helpers})
 
 @app.post("/admin/groups/save")
-async def group_save(
+def group_save(
     request: Request,
     id: Optional[int] = Form(None),
     name: str = Form(...),
@@ -590,7 +750,7 @@ async def group_save(
     pid = _to_opt_int(parent_id)
 
     if id:
-        g = db.query(Group).get(id)
+        g = db.get(Group, id)
         if not g:
             raise HTTPException(404)
         g.name = name
@@ -607,8 +767,8 @@ async def group_save(
     return RedirectResponse(url="/admin/groups", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/groups/{group_id}/delete")
-async def group_delete(group_id: int, db: Session = Depends(get_db)):
-    g = db.query(Group).get(group_id)
+def group_delete(group_id: int, db: Session = Depends(get_db)):
+    g = db.get(Group, group_id)
     if not g:
         raise HTTPException(404)
     child_count = db.query(Group).filter(Group.parent_id == group_id).count()
@@ -631,14 +791,14 @@ async def group_delete(group_id: int, db: Session = Depends(get_db)):
 
 # ---------- Functions CRUD + Import ----------
 @app.post("/admin/functions/import")
-async def import_functions_from_csv(
+def import_functions_from_csv(
     csv_file: UploadFile = File(...), 
     db: Session = Depends(get_db),
 ):
     if not csv_file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
 
-    content = await csv_file.read()
+    content = csv_file.file.read()
     try:
         content_as_string = content.decode('utf-8')
         reader = csv.reader(io.StringIO(content_as_string))
@@ -648,26 +808,23 @@ async def import_functions_from_csv(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Fehler beim Lesen der CSV-Datei: {e}")
 
-    functions_in_db = {f.id: f for f in db.query(Function).all()}
-
+    rows = []
     for row in reader:
         try:
             func_id = int(row[0])
             name = row[1]
 
-            if func_id in functions_in_db:
-                # Update existing function
-                func = functions_in_db[func_id]
-                func.name = name
-            else:
-                # Create new function
-                func = Function(id=func_id, name=name, legend_name=name, short_name=name)
-                db.add(func)
+            rows.append({"id": func_id, "name": name, "legend_name": name, "short_name": name})
 
         except (ValueError, IndexError) as e:
             print(f"Skipping row due to error: {row}, {e}")
             continue
 
+    # Insert new functions, existing ones only get the new name (upsert on id)
+    for batch in _batched(rows, CSV_BATCH_SIZE):
+        stmt = sqlite_insert(Function).values(batch)
+        db.execute(stmt.on_conflict_do_update(index_elements=[Function.id], set_={"name": stmt.excluded.name}))
+
     set_last_update(db)
     db.commit()
 
@@ -675,7 +832,7 @@ async def import_functions_from_csv(
 
 @app.get("/admin/functions", response_class=HTMLResponse)
 def functions_list(request: Request, db: Session = Depends(get_db)):
-    funcs = db.query(Function).order_by(Function.sort_order.asc(), Function.id.asc(), Function.name.asc()).all()
+    funcs = db.query(Function).options(*RAISELOAD).order_by(Function.sort_order.asc(), Function.id.asc(), Function.name.asc()).all()
     return templates.TemplateResponse("admin/functions_list.html", {"request": request, "functions": funcs})
 
 @app.get("/admin/functions/new", response_class=HTMLResponse)
@@ -684,7 +841,7 @@ def function_new(request: Request, db: Session = Depends(get_db)):
 
 @app.get("/admin/functions/{func_id}", response_class=HTMLResponse)
 def function_edit(func_id: int, request: Request, db: Session = Depends(get_db)):
-    f = db.query(Function).get(func_id)
+    f = db.get(Function, func_id)
     if not f:
         raise HTTPException(404)
     helpers = db.query(Helper).filter(
@@ -693,7 +850,7 @@ def function_edit(func_id: int, request: Request, db: Session = Depends(get_db))
     return templates.TemplateResponse("admin/functions_form.html", {"request": request, "func": f, "helpers": helpers})
 
 @app.post("/admin/functions/save")
-async def function_save(
+def function_save(
     id: Optional[int] = Form(None),
     name: str = Form(...),
     short_name: Optional[str] = Form(None),
@@ -703,19 +860,18 @@ async def function_save(
     emblem: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db)
 ):
-    exists = db.execute(select(Function).where(Function.name == name)).scalar_one_or_none()
-    if exists and (not id or exists.id != id):
+    existing_id = db.execute(select(Function.id).where(Function.name == name)).scalar()
+    if existing_id is not None and existing_id != id:
         raise HTTPException(status_code=400, detail="Funktion mit diesem Namen existiert bereits")
 
     emblem_path = None
 
-    if emblem and emblem.size > 0:
-        if os.path.splitext(emblem.filename or "")[1].lower() != '.svg':
-            raise HTTPException(status_code=400, detail="Emblem muss SVG sein")
-        emblem_path = save_upload(emblem, "uploads/emblems")
+    if emblem and emblem.filename:
+        # Endung und SVG-Kopf werden beim Speichern geprüft
+        emblem_path = _store_upload(emblem, "uploads/emblems")
 
     if id:
-        f = db.query(Function).get(id)
+        f = db.get(Function, id)
         if not f: raise HTTPException(404)
         f.name = name
         f.short_name = short_name
@@ -726,24 +882,25 @@ async def function_save(
         elif delete_emblem:
             f.emblem_svg_path = None
     else:
-        max_sort = db.query(sa_func.max(Function.sort_order)).scalar() or 0
-        sort_order = max_sort + 10
-        f = Function(name=name, short_name=short_name, legend_name=legend_name, sort_order=sort_order, emblem_svg_path=emblem_path)
+        f = Function(name=name, short_name=short_name, legend_name=legend_name, sort_order=_next_sort_order(Function.sort_order), emblem_svg_path=emblem_path)
         db.add(f)
         
     set_last_update(db)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Name wurde zwischen Prüfung und Commit vergeben (unique-Constraint auf functions.name)
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Funktion mit diesem Namen existiert bereits")
     return RedirectResponse(url="/admin/functions", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/functions/{func_id}/delete")
-async def function_delete(func_id: int, db: Session = Depends(get_db)):
-    f = db.query(Function).get(func_id)
+def function_delete(func_id: int, db: Session = Depends(get_db)):
+    f = db.get(Function, func_id)
     if f:
         if f.emblem_svg_path:
             try:
-                p = static_dir / f.emblem_svg_path
-                if p.exists():
-                    p.unlink()
+                (static_dir / f.emblem_svg_path).unlink(missing_ok=True)
             except Exception:
                 pass
         db.delete(f)
@@ -755,14 +912,14 @@ async def function_delete(func_id: int, db: Session = Depends(get_db)):
 
 # ---------- Helpers CRUD ----------
 @app.post("/admin/helpers/import_csv")
-async def import_helpers_from_csv(
+def import_helpers_from_csv(
     csv_file: UploadFile = File(...), 
     db: Session = Depends(get_db),
 ):
     if not csv_file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
 
-    content = await csv_file.read()
+    content = csv_file.file.read()
     try:
         content_as_string = content.decode('utf-8')
         reader = csv.reader(io.StringIO(content_as_string))
@@ -773,17 +930,27 @@ async def import_helpers_from_csv(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Fehler beim Lesen der CSV-Datei: {e}")
 
-    functions_map = {f.id for f in db.query(Function).all()}
-    groups_map = {g.id for g in db.query(Group).all()}
+    # Nur die in der CSV vorkommenden Gruppen, Funktionen und Helfer laden statt der ganzen Tabellen
+    rows = list(reader)
+    group_ids = {_opt_int(row[2]) for row in rows if len(row) > 2} - {None}
+    function_ids = {_opt_int(value) for row in rows for value in row[3:7]} - {None}
+    last_names = {row[1] for row in rows if len(row) > 1}
+    functions_map = {f.id: f for f in _load_in(db.query(Function), Function.id, function_ids)}
+    groups_map = {g.id for g in _load_in(db.query(Group.id), Group.id, group_ids)}
+    # Bestehende Helfer einmalig laden (inkl. Zusatzfunktionen für die Neuzuweisung)
+    helpers_by_name = {
+        (h.first_name, h.last_name): h
+        for h in _load_in(db.query(Helper).options(selectinload(Helper.secondary_functions)), Helper.last_name, last_names)
+    }
 
-    for row in reader:
+    for row in rows:
         try:
             first_name, last_name, group_id_str, main_function_id, zusatz1_str, zusatz2_str, zusatz3_str = row
             group_id = int(group_id_str)
             main_function_id = int(main_function_id)
-            zusatz1_id = int(zusatz1_str) if zusatz1_str.isdigit() else None
-            zusatz2_id = int(zusatz2_str) if zusatz2_str.isdigit() else None
-            zusatz3_id = int(zusatz3_str) if zusatz3_str.isdigit() else None
+            zusatz1_id = _opt_int(zusatz1_str)
+            zusatz2_id = _opt_int(zusatz2_str)
+            zusatz3_id = _opt_int(zusatz3_str)
             
             if group_id not in groups_map:
                 print(f"Skipping row: Group with ID {group_id} not found. Row: {row}")
@@ -810,7 +977,7 @@ async def import_helpers_from_csv(
             else:
                 zusatzfunktionen = []
 
-            helper = db.query(Helper).filter(Helper.first_name == first_name, Helper.last_name == last_name).first()
+            helper = helpers_by_name.get((first_name, last_name))
             if not helper:
                 helper = Helper(
                     first_name=first_name,
@@ -819,18 +986,12 @@ async def import_helpers_from_csv(
                     main_function_id=main_function_id
                 )
                 db.add(helper)
-                db.flush()
+                helpers_by_name[(first_name, last_name)] = helper
             else:
                 helper.group_id = group_id
                 helper.main_function_id = main_function_id
             
-            if zusatzfunktionen:
-                secondary_functions = db.query(Function).filter(Function.id.in_(zusatzfunktionen)).all()
-                helper.secondary_functions = secondary_functions
-            else:
-                helper.secondary_functions = []
-            
-            db.commit()
+            helper.secondary_functions = [functions_map[z] for z in dict.fromkeys(zusatzfunktionen)]
         except (ValueError, IndexError) as e:
             print(f"Skipping row due to error: {row}, {e}")
             continue
@@ -841,30 +1002,51 @@ async def import_helpers_from_csv(
     return RedirectResponse(url="/admin/helpers", status_code=HTTP_303_SEE_OTHER)
 
 @app.get("/admin/helpers", response_class=HTMLResponse)
-async def helpers_list(request: Request, db: Session = Depends(get_db)):
-    helpers = db.query(Helper).order_by(Helper.last_name.asc(), Helper.first_name.asc()).all()
-    return templates.TemplateResponse("admin/helpers_list.html", {"request": request, "helpers": helpers})
+def helpers_list(
+    request: Request,
+    after_last_name: Optional[str] = None,
+    after_first_name: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    query = db.query(Helper).options(joinedload(Helper.group), joinedload(Helper.main_function), *RAISELOAD)
+    # Keyset-Pagination (optional): Seite beginnt nach dem letzten Eintrag der vorherigen Seite
+    if after_last_name is not None and after_first_name is not None and after_id is not None:
+        query = query.filter(tuple_(Helper.last_name, Helper.first_name, Helper.id) > (after_last_name, after_first_name, after_id))
+    query = query.order_by(Helper.last_name.asc(), Helper.first_name.asc(), Helper.id.asc())
+    if limit:
+        query = query.limit(limit)
+    helpers = query.all()
+    next_page = None
+    if limit and len(helpers) == limit:
+        last = helpers[-1]
+        next_page = "/admin/helpers?" + urlencode({"after_last_name": last.last_name, "after_first_name": last.first_name, "after_id": last.id, "limit": limit})
+    return templates.TemplateResponse("admin/helpers_list.html", {"request": request, "helpers": helpers, "next_page": next_page})
 
 @app.get("/admin/helpers/new", response_class=HTMLResponse)
-async def helper_new(request: Request, db: Session = Depends(get_db)):
-    groups = db.query(Group).order_by(Group.sort_order.asc(), Group.name.asc()).all()
-    functions = db.query(Function).order_by(Function.sort_order.asc(), Function.name.asc()).all()
+def helper_new(request: Request, db: Session = Depends(get_db)):
+    groups = all_groups_sorted(db)
+    functions = all_functions_sorted(db)
     return templates.TemplateResponse("admin/helpers_form.html", {"request": request, "helper": None, "groups": groups, "functions": functions})
 
 @app.get("/admin/helpers/{helper_id}", response_class=HTMLResponse)
-async def helper_edit(helper_id: int, request: Request, db: Session = Depends(get_db)):
-    h = db.query(Helper).get(helper_id)
+def helper_edit(helper_id: int, request: Request, db: Session = Depends(get_db)):
+    h = db.get(Helper, helper_id)
     if not h: raise HTTPException(404)
-    groups = db.query(Group).order_by(Group.sort_order.asc(), Group.name.asc()).all()
-    functions = db.query(Function).order_by(Function.sort_order.asc(), Function.name.asc()).all()
-    sec_ids = ",".join(str(f.id) for f in h.secondary_functions)
-    return templates.TemplateResponse("admin/helpers_form.html", {"request": request, "helper": h, "groups": groups, "functions": functions, "sec_ids": sec_ids})
+    groups = all_groups_sorted(db)
+    functions = all_functions_sorted(db)
+    # Für das Formular reichen die IDs der Zusatzfunktionen, die Function-Objekte liegen schon in functions
+    assoc = helper_secondary_functions.c
+    secondary_ids = db.execute(select(assoc.function_id).where(assoc.helper_id == h.id)).scalars().all()
+    sec_ids = ",".join(str(fid) for fid in secondary_ids)
+    return templates.TemplateResponse("admin/helpers_form.html", {"request": request, "helper": h, "groups": groups, "functions": functions, "sec_ids": sec_ids, "secondary_ids": set(secondary_ids)})
 
 @app.post("/admin/helpers/save")
-async def helper_save(id: Optional[int] = Form(None), first_name: str = Form(...), last_name: str = Form(...), group_id: int = Form(...), main_function_id: int = Form(...), secondary_function_ids: Optional[str] = Form(""), photo: Optional[UploadFile] = File(None), delete_photo: Optional[str] = Form(None), db: Session = Depends(get_db)):
-    photo_path = save_upload(photo, "uploads/photos") if photo and photo.size > 0 else None
+def helper_save(id: Optional[int] = Form(None), first_name: str = Form(...), last_name: str = Form(...), group_id: int = Form(...), main_function_id: int = Form(...), secondary_function_ids: Optional[str] = Form(""), photo: Optional[UploadFile] = File(None), delete_photo: Optional[str] = Form(None), db: Session = Depends(get_db)):
+    photo_path = _store_upload(photo, "uploads/photos") if photo and photo.size > 0 else None
     if id:
-        h = db.query(Helper).get(id)
+        h = db.get(Helper, id)
         if not h: raise HTTPException(404)
         h.first_name = first_name
         h.last_name = last_name
@@ -873,16 +1055,14 @@ async def helper_save(id: Optional[int] = Form(None), first_name: str = Form(...
         if delete_photo:
             try:
                 if h.photo_path:
-                    p = static_dir / h.photo_path
-                    if p.exists(): p.unlink()
+                    (static_dir / h.photo_path).unlink(missing_ok=True)
             except Exception:
                 pass
             h.photo_path = None
         elif photo_path:
             if h.photo_path:
                 try:
-                    p = static_dir / h.photo_path
-                    if p.exists(): p.unlink()
+                    (static_dir / h.photo_path).unlink(missing_ok=True)
                 except Exception:
                     pass
             h.photo_path = photo_path
@@ -890,26 +1070,34 @@ async def helper_save(id: Optional[int] = Form(None), first_name: str = Form(...
         h = Helper(first_name=first_name, last_name=last_name, group_id=group_id, main_function_id=main_function_id, photo_path=photo_path)
         db.add(h)
         db.flush()
-    sec_ids = [int(x) for x in (secondary_function_ids or "").split(",") if x.strip().isdigit()]
-    if sec_ids:
-        funcs = db.query(Function).filter(Function.id.in_(sec_ids)).all()
-        h.secondary_functions = funcs
-    else:
-        h.secondary_functions = []
+    # Nur tatsächlich geänderte Zusatzfunktionen schreiben, direkt auf der Zuordnungstabelle
+    # (ein DELETE und ein mehrzeiliges INSERT statt Einzelzeilen über die ORM-Collection)
+    sec_ids = {int(x) for x in (secondary_function_ids or "").split(",") if x.strip().isdigit()}
+    assoc = helper_secondary_functions.c
+    current_ids = set(db.execute(select(assoc.function_id).where(assoc.helper_id == h.id)).scalars()) if id else set()
+    to_remove = current_ids - sec_ids
+    to_add = sec_ids - current_ids
+    if to_add:
+        # Unbekannte IDs überspringen, wie zuvor beim Laden über die ORM-Collection
+        to_add = set(db.execute(select(Function.id).where(Function.id.in_(to_add))).scalars())
+    if to_remove:
+        db.execute(delete(helper_secondary_functions).where(assoc.helper_id == h.id, assoc.function_id.in_(to_remove)))
+    if to_add:
+        db.execute(insert(helper_secondary_functions), [{"helper_id": h.id, "function_id": fid} for fid in to_add])
+    if to_remove or to_add:
+        db.expire(h, ["secondary_functions"])
     
     set_last_update(db)
     db.commit()
     return RedirectResponse(url="/admin/helpers", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/helpers/{helper_id}/delete")
-async def helper_delete(helper_id: int, db: Session = Depends(get_db)):
-    h = db.query(Helper).get(helper_id)
+def helper_delete(helper_id: int, db: Session = Depends(get_db)):
+    h = db.get(Helper, helper_id)
     if h:
         if h.photo_path:
             try:
-                p = static_dir / h.photo_path
-                if p.exists():
-                    p.unlink()
+                (static_dir / h.photo_path).unlink(missing_ok=True)
             except Exception:
                 pass
         db.delete(h)
@@ -918,8 +1106,8 @@ async def helper_delete(helper_id: int, db: Session = Depends(get_db)):
     return RedirectResponse(url="/admin/helpers", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/helpers/{helper_id}/delete_photo")
-async def helper_delete_photo(helper_id: int, db: Session = Depends(get_db)):
-    h = db.query(Helper).get(helper_id)
+def helper_delete_photo(helper_id: int, db: Session = Depends(get_db)):
+    h = db.get(Helper, helper_id)
     if h and h.photo_path:
         try:
             delete_original_and_thumbnails(Path(h.photo_path), static_dir)
@@ -931,81 +1119,96 @@ async def helper_delete_photo(helper_id: int, db: Session = Depends(get_db)):
     return RedirectResponse(url=f"/admin/helpers/{helper_id}", status_code=HTTP_303_SEE_OTHER)
 
 @app.post("/admin/helpers/import_photos")
-async def import_photos(zip_file: UploadFile = File(...), db: Session = Depends(get_db)):
+def import_photos(zip_file: UploadFile = File(...), db: Session = Depends(get_db)):
     if not zip_file.filename.lower().endswith('.zip'):
         raise HTTPException(status_code=400, detail="Nur ZIP-Dateien erlaubt")
-    print("Starte Import Fotos aus ZIP …")
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_path = Path(temp_dir) / "photos.zip"
-        
-        print(f"Versuche zu entpacken: {zip_path}")
-        print(f"Zielverzeichnis: {temp_dir}")
 
-        try:
-            with zip_path.open("wb") as f:
-                f.write(await zip_file.read())
-        except Exception as e:
-            print(f"Fehler beim Entpacken: {e}")
-                  
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                files = zip_ref.namelist()
-                print(f"Dateien im ZIP: {len(files)} Stück")
-                
-                zip_ref.extractall(temp_dir)
-                
-            actual_files = os.listdir(temp_dir)
-            print(f"Inhalt von {temp_dir} nach Entpacken: {actual_files}")
-        except Exception as e:
-            print(f"Fehler beim Entpacken: {e}")
-        
-        updated_count = 0
-        for file_path in Path(temp_dir).rglob("*.jpg", case_sensitive=False):
-            filename = file_path.name
-            print(f"Verarbeite Bild: {filename}")
-            if filename.lower().endswith('.jpg'):
+    matches = []
+    photo_paths = []
+    try:
+        # ZipFile liest direkt aus der temporären Datei des Uploads, kein Zwischenkopieren nach photos.zip
+        zip_file.file.seek(0)
+        with zipfile.ZipFile(zip_file.file, 'r') as zip_ref:
+            # Nur passende JPGs direkt aus dem Archiv ins Upload-Verzeichnis schreiben, kein extractall
+            candidates = []
+            for info in zip_ref.infolist():
+                if info.is_dir() or not info.filename.lower().endswith('.jpg') or '__MACOSX' in info.filename:
+                    continue
+                filename = info.filename.rsplit('/', 1)[-1]
                 name_part = filename[:-4]
                 parts = name_part.split(' ', 1)
                 if len(parts) == 2:
                     last_name, first_name = parts
-                    helper = db.query(Helper).filter(
-                        Helper.last_name.ilike(last_name.strip()),
-                        Helper.first_name.ilike(first_name.strip())
-                    ).first()
-                    if helper:
-                        print(f"  Gefunden: {helper.first_name} {helper.last_name} (ID: {helper.id})")
-                        photo_path = save_upload_from_path(file_path, "uploads/photos")
-                        if helper.photo_path:
-                            print(f"Lösche altes Foto: {helper.photo_path}")
-                            try:
-                                delete_original_and_thumbnails(Path(helper.photo_path), static_dir)
-                            except Exception as e:
-                                print(f"Error deleting old photo: {e}")
-                        if photo_path:
-                            helper.photo_path = photo_path
-                            updated_count += 1
-                            print(f"Foto aktualisiert.")
-        
-        print(f"Import abgeschlossen. {updated_count} Fotos aktualisiert.")
-        
-        if updated_count > 0:
-            set_last_update(db)
-            db.commit()
+                    candidates.append((info, (last_name.strip().lower(), first_name.strip().lower())))
+
+            # Alle Helfer einmal laden und per (Nachname, Vorname) ohne Groß-/Kleinschreibung zuordnen
+            # (in Python, da SQLite lower() nur A-Z umwandelt)
+            helpers_by_name = {
+                (h.last_name.strip().lower(), h.first_name.strip().lower()): h
+                for h in db.query(Helper).all()
+            }
+            for info, key in candidates:
+                helper = helpers_by_name.get(key)
+                if helper:
+                    matches.append((info, helper))
+
+            # Zielverzeichnis einmal anlegen, nicht pro Datei
+            (static_dir / "uploads/photos").mkdir(parents=True, exist_ok=True)
+            # Kopieren und Thumbnails parallel; die Session wird nur im Haupt-Thread verändert
+            workers = min(8, os.cpu_count() or 1)
+            # Encoder-Threads pro Foto begrenzen, damit insgesamt nicht mehr als ENCODE_WORKERS gleichzeitig laufen
+            encode_workers = max(1, ENCODE_WORKERS // workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                photo_paths = list(executor.map(
+                    save_upload_from_zip, itertools.repeat(zip_ref), [info for info, _ in matches], itertools.repeat("uploads/photos"),
+                    itertools.repeat(encode_workers)
+                ))
+    except Exception as e:
+        logger.error("Fehler beim Entpacken von %s: %s", zip_file.filename, e)
+
+    # Neue Pfade je Helfer sammeln (bei mehreren Fotos für denselben Helfer gewinnt das letzte)
+    # und anschließend mit einem Bulk-UPDATE schreiben statt die ORM-Objekte einzeln zu ändern
+    new_photo_paths = {}
+    for (info, helper), photo_path in zip(matches, photo_paths):
+        # Bei fehlgeschlagenem Eintrag bleibt das bisherige Foto erhalten
+        if not photo_path:
+            continue
+        old_photo_path = new_photo_paths.get(helper.id, helper.photo_path)
+        if old_photo_path:
+            try:
+                delete_original_and_thumbnails(Path(old_photo_path), static_dir)
+            except Exception as e:
+                logger.warning("Error deleting old photo %s: %s", old_photo_path, e)
+        new_photo_paths[helper.id] = photo_path
+    updated_count = len(new_photo_paths)
+    
+    logger.info("Foto-Import abgeschlossen: %d Fotos aktualisiert", updated_count)
     
+    if updated_count > 0:
+        db.execute(update(Helper), [{"id": helper_id, "photo_path": path} for helper_id, path in new_photo_paths.items()])
+        set_last_update(db)
+        db.commit()
+
     return RedirectResponse(url="/admin/helpers", status_code=HTTP_303_SEE_OTHER)
 
-def save_upload_from_path(file_path: Path, subdir: str) -> Optional[str]:
-    ext = file_path.suffix.lower()
-    target_dir = static_dir / subdir
-    target_dir.mkdir(parents=True, exist_ok=True)
-    fname = f"{os.urandom(8).hex()}{ext}"
-    out_path = target_dir / fname
-    import shutil
-    shutil.copy(file_path, out_path)
-    
-    # Generate thumbnail variants if it's an image (not SVG)
-    if subdir != "uploads/emblems" and ext in {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}:
-        generate_thumbnails(out_path, static_dir)
+def save_upload_from_zip(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, subdir: str, encode_workers: Optional[int] = None) -> Optional[str]:
+    # Das Zielverzeichnis legt der Aufrufer vorab einmal an
+    ext = os.path.splitext(info.filename)[1].lower()
+    fname = f"{secrets.token_hex(8)}{ext}"
+    # Pfade als Strings, ein Path-Objekt nur für die Thumbnail-Erzeugung
+    out_path = os.path.join(os.fspath(static_dir), subdir, fname)
+    try:
+        # Eintrag direkt entpacken und schreiben, ohne Umweg über ein temporäres Verzeichnis
+        with zip_ref.open(info) as src, open(out_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, length=1 << 20)
+        
+        # Generate thumbnail variants if it's an image (not SVG)
+        if subdir != "uploads/emblems" and ext in THUMBNAIL_EXTENSIONS:
+            generate_thumbnails(Path(out_path), static_dir, encode_workers=encode_workers)
+    except Exception as e:
+        # Fehlerhafte Einträge (z.B. CRC-Fehler) einzeln überspringen, die übrigen Fotos trotzdem importieren
+        logger.error("Fehler beim Entpacken von %s: %s", info.filename, e)
+        delete_original_and_thumbnails(Path(out_path), static_dir)
+        return None
     
     return f"{subdir}/{fname}"
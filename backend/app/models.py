@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -12,6 +12,7 @@ helper_secondary_functions = Table(
 
 class Group(Base):
     __tablename__ = "groups"
+    __table_args__ = (Index("ix_group_tree", "parent_id", "sort_order", "name"),)
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     parent_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
@@ -25,6 +26,7 @@ class Group(Base):
 
 class Function(Base):
     __tablename__ = "functions"
+    __table_args__ = (Index("ix_function_sort", "sort_order", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, unique=True)
     short_name = Column(String, nullable=True)
@@ -36,6 +38,7 @@ class Function(Base):
 
 class Helper(Base):
     __tablename__ = "helpers"
+    __table_args__ = (Index("ix_helper_name", "last_name", "first_name"),)
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
@@ -2,33 +2,48 @@
 
 from sqlalchemy import create_engine, text
 from app.database import Base
+import app.models  # noqa: F401  (registriert die Tabellen in Base.metadata für create_all)
 
 # Engine für die bestehende DB
 engine = create_engine("sqlite:///./app.db")
 
 # Neue Spalten zur groups Tabelle hinzufügen
 with engine.connect() as conn:
-    # detail_enabled hinzufügen
-    try:
-        conn.execute(text("ALTER TABLE groups ADD COLUMN detail_enabled BOOLEAN DEFAULT 0"))
-        print("Added detail_enabled to groups")
-    except Exception as e:
-        print(f"detail_enabled already exists or error: {e}")
-    
-    # description hinzufügen
-    try:
-        conn.execute(text("ALTER TABLE groups ADD COLUMN description TEXT"))
-        print("Added description to groups")
-    except Exception as e:
-        print(f"description already exists or error: {e}")
+    # WAL-Modus wird in der Datenbankdatei gespeichert und gilt danach für alle Verbindungen
+    conn.execute(text("PRAGMA journal_mode=WAL"))
 
-    # legend_name hinzufügen
-    try:
-        conn.execute(text("ALTER TABLE functions ADD COLUMN legend_name TEXT"))
-        print("Added legend_name to functions")
-    except Exception as e:
-        print(f"legend_name already exists or error: {e}")
+    # Fehlende Spalten anhand von PRAGMA table_info ermitteln, statt fehlschlagende ALTERs abzufangen
+    new_columns = [
+        ("groups", "detail_enabled", "BOOLEAN DEFAULT 0"),
+        ("groups", "description", "TEXT"),
+        ("functions", "legend_name", "TEXT"),
+    ]
+    existing = {}
+    for table, column, ddl in new_columns:
+        if table not in existing:
+            existing[table] = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+            if not existing[table]:
+                print(f"{table} does not exist yet, created with all columns below")
+        if not existing[table]:
+            continue
+        if column in existing[table]:
+            print(f"{column} already exists in {table}")
+        else:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            print(f"Added {column} to {table}")
+    conn.commit()
 
 # Neue Tabelle group_images erstellen
 Base.metadata.create_all(bind=engine)
-print("Created tables if not exist")
\ No newline at end of file
+print("Created tables if not exist")
+
+# Indizes erst nach create_all anlegen, damit die Tabellen auch bei einer neuen DB existieren
+with engine.connect() as conn:
+    # Indizes für die Sortierungen der Listen (create_all legt sie bei bestehenden Tabellen nicht an)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_group_tree ON groups (parent_id, sort_order, name)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_function_sort ON functions (sort_order, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_helper_name ON helpers (last_name, first_name)"))
+    # Früherer Ausdrucks-Index für den Foto-Import wird nicht mehr verwendet
+    conn.execute(text("DROP INDEX IF EXISTS ix_helper_name_ci"))
+    conn.commit()
+    print("Created indexes if not exist")
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Öffentliche Seiten und Helferliste mit raiseload('*'): jede nicht vorab geladene Relation lässt den Test fehlschlagen."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+# DEBUG und der relative DB-Pfad (./db/app.db) werden beim Import von app.main ausgewertet
+os.environ["DEBUG"] = "true"
+os.environ.setdefault("ENV", "dev")
+_workdir = tempfile.mkdtemp(prefix="helferboard-test-")
+os.makedirs(os.path.join(_workdir, "db"))
+_old_cwd = os.getcwd()
+os.chdir(_workdir)
+try:
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.database import SessionLocal
+    from app.models import Group, Function, Helper
+finally:
+    os.chdir(_old_cwd)
+
+
+@pytest.fixture(scope="module")
+def client():
+    os.chdir(_workdir)
+    try:
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        os.chdir(_old_cwd)
+
+
+@pytest.fixture(scope="module")
+def group_id(client):
+    db = SessionLocal()
+    try:
+        main_function = Function(name="Zugführer", short_name="ZF", sort_order=1)
+        secondary_function = Function(name="Sprechfunker", short_name="SF", sort_order=2)
+        group = Group(name="1. Technischer Zug", sort_order=1, detail_enabled=True)
+        db.add(Helper(first_name="Erika", last_name="Mustermann", group=group, main_function=main_function, secondary_functions=[secondary_function]))
+        db.commit()
+        return group.id
+    finally:
+        db.close()
+
+
+def test_raiseload_enabled():
+    assert main.RAISELOAD
+
+
+def test_public_index(client, group_id):
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "Mustermann" in response.text
+
+
+def test_group_detail(client, group_id):
+    response = client.get(f"/group/{group_id}")
+    assert response.status_code == 200
+    assert "Mustermann" in response.text
+
+
+def test_admin_helpers(client, group_id):
+    response = client.get("/admin/helpers")
+    assert response.status_code == 200
+    assert "Mustermann" in response.text